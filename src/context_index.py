@@ -0,0 +1,142 @@
+# context_index.py
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from openai import OpenAI
+from rank_bm25 import BM25Okapi
+
+if __package__:
+    from .embed_cache import get_or_embed, get_or_embed_many
+else:  # run as a script from src/
+    from embed_cache import get_or_embed, get_or_embed_many
+
+CONTEXT_PATH = Path(__file__).parent / "data" / "context.txt"
+INDEX_PATH = CONTEXT_PATH.parent / "context.faiss"
+CHUNKS_PATH = CONTEXT_PATH.parent / "context_chunks.json"
+# Vectors are stored as 8-bit scalar-quantized codes: a quarter of the float32
+# size, and search is memory-bandwidth bound, with negligible recall loss at
+# this corpus size. Bump the tag when the index layout changes.
+INDEX_TYPE = "sq8"
+# Memory-maps the quantized codes instead of reading them into memory. Older
+# faiss releases lack the flag and read the index normally.
+INDEX_READ_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+# search_context runs in worker threads for concurrent questions, so building
+# and loading the index is serialized and done once per process.
+_index_lock = threading.Lock()
+_loaded: Optional[Tuple[faiss.Index, List[str], BM25Okapi]] = None
+
+
+def context_hash() -> str:
+    """SHA-256 of the context file, used to detect when derived data is stale."""
+    return hashlib.sha256(CONTEXT_PATH.read_bytes()).hexdigest()
+
+
+def chunk_context(text: str, lines_per_chunk: int = 30, overlap: int = 5) -> List[str]:
+    """Split the context into overlapping windows of lines."""
+    lines = text.splitlines()
+    step = lines_per_chunk - overlap
+    return [
+        "\n".join(lines[start:start + lines_per_chunk])
+        for start in range(0, max(len(lines) - overlap, 1), step)
+    ]
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def build_index(client: Optional[OpenAI] = None) -> None:
+    """Embed the context chunks and write the FAISS index and chunk list."""
+    chunks = chunk_context(CONTEXT_PATH.read_text())
+    vectors = np.asarray(get_or_embed_many(chunks, client=client), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexScalarQuantizer(
+        vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    index.train(vectors)
+    index.add(vectors)
+    faiss.write_index(index, str(INDEX_PATH))
+    CHUNKS_PATH.write_text(
+        json.dumps({"context_hash": context_hash(), "index_type": INDEX_TYPE, "chunks": chunks})
+    )
+
+
+def load_index(client: Optional[OpenAI] = None) -> Tuple[faiss.Index, List[str], BM25Okapi]:
+    """Load the vector index and build the keyword index, once per process.
+
+    The index is rebuilt first when it is missing, was built with a different
+    layout, or the context has changed.
+    """
+    global _loaded
+    with _index_lock:
+        if _loaded is not None:
+            return _loaded
+
+        try:
+            saved = json.loads(CHUNKS_PATH.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            saved = {}
+        if (
+            saved.get("context_hash") != context_hash()
+            or saved.get("index_type") != INDEX_TYPE
+            or not INDEX_PATH.exists()
+        ):
+            build_index(client)
+            saved = json.loads(CHUNKS_PATH.read_text())
+
+        chunks = saved["chunks"]
+        index = faiss.read_index(str(INDEX_PATH), INDEX_READ_FLAGS)
+        keywords = BM25Okapi([tokenize(chunk) for chunk in chunks])
+        _loaded = (index, chunks, keywords)
+        return _loaded
+
+
+def search_context(
+    query: str,
+    k: int = 5,
+    client: Optional[OpenAI] = None,
+    candidates: int = 20,
+    rrf_k: int = 60,
+) -> List[dict]:
+    """Hybrid keyword + vector search over the context chunks.
+
+    Exact references such as "Note 5" or "fiscal 2024" are matched by BM25,
+    paraphrases by embedding similarity; the two rankings are combined with
+    reciprocal rank fusion.
+    """
+    index, chunks, keywords = load_index(client)
+
+    # Only chunks sharing a term with the query are ranked; the order among
+    # zero-score chunks is arbitrary and would add noise to the fusion
+    keyword_scores = keywords.get_scores(tokenize(query))
+    keyword_ranking = [i for i in np.argsort(-keyword_scores)[:candidates] if keyword_scores[i] > 0]
+
+    query_vector = np.asarray([get_or_embed(query, client=client)], dtype=np.float32)
+    faiss.normalize_L2(query_vector)
+    _, neighbours = index.search(query_vector, min(candidates, index.ntotal))
+    vector_ranking = [i for i in neighbours[0] if i >= 0]
+
+    fused: Dict[int, float] = {}
+    for ranking in (keyword_ranking, vector_ranking):
+        for rank, i in enumerate(ranking, 1):
+            fused[int(i)] = fused.get(int(i), 0.0) + 1.0 / (rrf_k + rank)
+
+    top = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [
+        {"chunk": i, "score": fused[i], "text": chunks[i]}
+        for i in top
+    ]
+
+
+if __name__ == "__main__":
+    build_index()
+    print(f"Wrote {INDEX_PATH} and {CHUNKS_PATH}")
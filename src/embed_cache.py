@@ -0,0 +1,73 @@
+# embed_cache.py
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from openai import OpenAI
+
+# Embeddings are stored as float32 blobs keyed by SHA-256 of model + text, so
+# repeated queries and unchanged context chunks never hit the embeddings API.
+CACHE_PATH = Path(__file__).parent / "data" / ".embed_cache.sqlite"
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBED_BATCH_SIZE = 256
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS emb_cache (sha TEXT PRIMARY KEY, model TEXT NOT NULL, vec BLOB NOT NULL)"
+    )
+    return conn
+
+
+def _key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def get_or_embed_many(
+    texts: List[str],
+    client: Optional[OpenAI] = None,
+    model: str = EMBEDDING_MODEL,
+) -> List[List[float]]:
+    """Return embeddings for ``texts``, calling the API only for unseen texts."""
+    keys = [_key(text, model) for text in texts]
+    vectors: dict = {}
+
+    with closing(_connect()) as conn, conn:
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT sha, vec FROM emb_cache WHERE sha IN ({placeholders})", chunk
+            )
+            for sha, blob in rows:
+                vectors[sha] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        missing = list({key: text for key, text in zip(keys, texts) if key not in vectors}.items())
+        if missing:
+            client = client or OpenAI()
+            for start in range(0, len(missing), EMBED_BATCH_SIZE):
+                batch = missing[start:start + EMBED_BATCH_SIZE]
+                response = client.embeddings.create(model=model, input=[text for _, text in batch])
+                for (key, _), item in zip(batch, response.data):
+                    vectors[key] = item.embedding
+                    conn.execute(
+                        "INSERT OR REPLACE INTO emb_cache (sha, model, vec) VALUES (?, ?, ?)",
+                        (key, model, np.asarray(item.embedding, dtype=np.float32).tobytes()),
+                    )
+
+    return [vectors[key] for key in keys]
+
+
+def get_or_embed(
+    text: str,
+    client: Optional[OpenAI] = None,
+    model: str = EMBEDDING_MODEL,
+) -> List[float]:
+    """Return the embedding for ``text``, from the cache when it was seen before."""
+    return get_or_embed_many([text], client=client, model=model)[0]
@@ -1,522 +1,755 @@
 # orchestrator_triage.py
 from __future__ import annotations
 
+import argparse
 import asyncio
+import contextvars
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
 import os
+import queue
+import sys
+import time
 import uuid
-import requests
+import httpx
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from types import SimpleNamespace
 from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
 
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 
 from agents import (
     Agent,
+    AgentOutputSchema,
     ModelSettings,
     function_tool,
+    handoff,
+    HandoffOutputItem,
+    ToolCallItem,
+    ToolCallOutputItem,
+    set_default_openai_client,
     RawResponsesStreamEvent,
+    RunContextWrapper,
     Runner,
+    StopAtTools,
     TResponseInputItem,
     trace,
 )
 from openai.types.responses import ResponseContentPartDoneEvent, ResponseTextDeltaEvent
 
-from agents import FileSearchTool, WebSearchTool
+from agents import WebSearchTool
 
-file_search_tool = FileSearchTool(
-    vector_store_ids=["vs_68993210d6d481918d95319746f5d133"],   # your vector store ID(s)
-    max_num_results=5,                    # optional: limit search results
-    include_search_results=True,          # include retrieved chunks in output
-    ranking_options=None,                 # optional: custom ranking strategy
-    filters=None                          # optional: filter by file attributes
+if __package__:
+    from .context_index import CONTEXT_PATH, context_hash, search_context
+else:  # run as a script from src/
+    from context_index import CONTEXT_PATH, context_hash, search_context
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis is optional; fall back to the in-memory cache
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging() -> QueueListener:
+    """Send log records to stdout from a listener thread, for script runs.
+
+    Records go through a queue, so concurrent question tasks never block the
+    event loop on stdout.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, handler)
+    logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)])
+    # httpx logs every request at INFO, which would drown out the answers
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    listener.start()
+    return listener
+
+
+# Shared clients so TLS sessions and keep-alive connections are reused across
+# runs. They are created on first use so importing this module does not need
+# OPENAI_API_KEY; main() registers the async one as the agents SDK default.
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+@functools.cache
+def get_client() -> OpenAI:
+    return OpenAI(http_client=DefaultHttpxClient(limits=_HTTP_LIMITS))
+
+
+@functools.cache
+def get_async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(http_client=DefaultAsyncHttpxClient(limits=_HTTP_LIMITS))
+
+
+VECTOR_STORE_CACHE_PATH = CONTEXT_PATH.parent / ".vs_cache.json"
+
+
+def load_vector_store_cache() -> Dict[str, str]:
+    """Read the ``{context hash: vector store id}`` sidecar, if present."""
+    try:
+        return json.loads(VECTOR_STORE_CACHE_PATH.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def ensure_vector_store(client: OpenAI) -> str:
+    """Upload the context only when it changed since the last upload.
+
+    Only the --batch path uses the hosted vector store; interactive runs
+    search the local index.
+    """
+    digest = context_hash()
+    cache = load_vector_store_cache()
+    vector_store_id = cache.get(digest)
+    if vector_store_id is None:
+        vector_store = client.vector_stores.create(
+            name="financial_context",
+        )
+        with CONTEXT_PATH.open("rb") as context_file:
+            client.vector_stores.files.upload_and_poll(
+                vector_store_id=vector_store.id,
+                file=context_file,
+            )
+        vector_store_id = vector_store.id
+        cache[digest] = vector_store_id
+        VECTOR_STORE_CACHE_PATH.write_text(json.dumps(cache, indent=2))
+
+    return vector_store_id
+
+
+# Retrieval results already fetched for the question being answered. The
+# triage, specialist and critic hops often repeat the same lookups.
+_search_cache: contextvars.ContextVar[Optional[Dict[bytes, str]]] = contextvars.ContextVar(
+    "search_cache", default=None
 )
 
+
+def reset_search_cache() -> None:
+    """Start a fresh retrieval cache for the current question."""
+    _search_cache.set({})
+
+
+def make_cached_file_search(max_num_results: int):
+    """Wrap context retrieval in a function tool with a per-question cache.
+
+    ``FileSearchTool`` runs server side and cannot be intercepted, so search
+    runs locally over the context file with ``search_context``, using the
+    FAISS index and the persistent embedding cache, and returns
+    ``max_num_results`` chunks.
+    """
+
+    @function_tool
+    async def search_context_file(query: str) -> str:
+        """Search the financial context file for passages relevant to a query.
+
+        Args:
+            query: Specific search terms, e.g. "current portion long-term debt 2024".
+        """
+        key = hashlib.blake2b(
+            json.dumps([query, max_num_results]).encode("utf-8")
+        ).digest()
+        cache = _search_cache.get()
+        if cache is not None and key in cache:
+            return cache[key]
+
+        hits = await asyncio.to_thread(search_context, query, max_num_results, get_client())
+        output = json.dumps(hits)
+
+        if cache is not None:
+            cache[key] = output
+        return output
+
+    return search_context_file
+
+
+# Every retrieved chunk is fed to the next model turn, so result counts are
+# sized per agent: basic questions need a single figure or two, while
+# assumption questions pull several components.
+cached_file_search = make_cached_file_search(5)
+basic_file_search = make_cached_file_search(2)
+
 web_search_tool = WebSearchTool(
     user_location=None,  # Optional location for search results
     search_context_size="medium"  # "low", "medium", or "high"
 )
 
-triage_agent_prompt = """
-    # Identity
-    You are the **Financial Question Triage Agent**—an expert system designed to analyze and classify finance-related questions with precision and consistency.
-    and handoff to the appropriate agent based on the question and give the agent question and the context. DO NOT try to answer the question yourself or output your own answer.
+PROMPTS_DIR = Path(__file__).parent / "prompts"
 
-    ## Mission
-    Your role is to carefully read each financial question and assign it to one—and only one—of the following categories, based on the nature of the information required and the reasoning involved:
 
-      1. **Tactical – Basic**: Directly answerable from provided data or simple calculations.
-      2. **Tactical – Assumption-Based**: Requires logical assumptions, estimates, or filling in missing data.
-      3. **Conceptual**: 	If the question only asks for the meaning, definition, or explanation of a financial term or metric — with no request for a number
-    
-    #instructions
-    - Do not decide based solely on whether the question mentions an entity or date — missing entity/date often still means assumption-based.
-    - all tactic question is asked about the company in the context file. If the question is not about the company in the context file, it is a conceptual question.
-    - If a question asks for a financial metric or ratio (e.g., market debt-to-equity, market cap to EBITDA), first determine the formula required to answer. Then check if every variable for that formula is explicitly provided in the given context.
-    - DO NOT directly classify as basic even if the value might be directly in the context, even though the value asked might be directly in the context, reason to ensure there's no further steps that can be taken to derive that value if variables in the process of deriving such value are not found, classify it as an assumption question.
-
-    ## Tool Usage Instructions
-    - You are provided with a tool to search data from the context file to validate your answer 
-    - If the question is tactical, you MUST use the tool to search the context file to validate your answer.
-    - Handoff to the appropriate agent based on the question and give the agent question and the context.
-
-    #Input
-    - The user's financial question.
-    - The context of the question.
-
-    #Examples
-
-    <category name="Tactical – Basic">
-      <example>What is Gross Profit in the year ending 2024?</example>
-      <example>Calculate Inventory Turnover for 2024.</example>
-    </category>
-
-    <category name="Tactical – Assumption-Based">
-      <example>Determine the EV/Sales ratio for 2024.</example>
-      <example>What is adjusted EBITDA for the year ending in 2024?</example>
-      <example> What is market debt to equity ratio?</example>
-    </category>
-
-    <category name="Conceptual">
-      <example>Company X trades at $15 per share and has 80 shares outstanding, with $80 in net income. Company Y trades at $30 per share, has 15 shares outstanding, and earns $20 in net income. Company X acquires Company Y at no premium, paying 60% in new stock and 40% in cash. After the transaction, what is the percentage change in Company X's EPS?</example>
-      <example>You have two potential investments, Company X and Company Y. Both companies are available at the same purchase price and both project a levered IRR of 25%. However, investing in Company X requires 4 turns of leverage while investing in Company Y requires 7 turns. Which investment has a higher unlevered IRR?</example>
-    </category>
-
-    #Output Format
-    - Only output in JSON format following the format below.
-    - Example output:
-    {
-        "classification": "conceptual",
-        "reason": "The question asks for a financial metric (Gross Profit) for a specific year (2024), which can be directly calculated from the provided context.",
-        "search_results": "Search results that informed your decision"
-    }
+@functools.cache
+def load_prompt(name: str) -> str:
+    """Read an agent prompt from ``src/prompts`` and fill in the handoff prefix."""
+    return (PROMPTS_DIR / name).read_text().replace(
+        "{RECOMMENDED_PROMPT_PREFIX}", RECOMMENDED_PROMPT_PREFIX
+    )
 
-    #Handoff Instructions
-    - handoff to basic agent if the question is tactical - basic
-    - handoff to assumption agent if the question is tactical - assumption-based
-    - handoff to conceptual agent if the question is conceptual
-
-    Do not try to answer the question yourself. Make sure Handoff to the appropriate agent based on the question and give the agent question and the context.
-   
-"""
-
-basic_agent_prompt = """
-# Role and Objective
-
-You are a financial analysis expert.
-Your goal is to interpret and answer conceptual financial questions that may require explaining definitions, validating them against standard sources, and illustrating them with clear, step-by-step reasoning (which can include generic example calculations).
-You must produce a clear, structured, and logically sound answer that is validated against authoritative definitions and best practices in finance.
-
-⸻
-
-# Instructions
-	1.	Identify the nature of the question:
-	•	Is it purely definitional?
-	•	Is it definitional plus a worked example?
-	•	Does it require interpreting a concept in a specific scenario?
-	2.	Validate your understanding of the concept against standard authoritative definitions (e.g., CFA curriculum, Investopedia, corporate finance textbooks).
-	3.	Explain the concept clearly in plain language.
-	4.	If an example is included in the question:
-	•	Translate the scenario into the relevant financial framework or formula.
-	•	Execute the reasoning in a step-by-step manner, labeling each part (inputs, formulas, intermediate results, final conclusion).
-	5.	Verify:
-	•	That your conclusion aligns with the validated definition.
-	•	That no step contradicts standard practice.
-	6.	Be transparent about any assumptions made.
-	7.	Keep your reasoning modular—each step should be understandable without relying on hidden intermediate steps.
-
-⸻
-
-## Sub-categories for more detailed instructions
-
-A. Concept Recognition
-	•	Detect the underlying concept being tested (e.g., accretive vs. dilutive, NPV, IRR, market-to-book ratio).
-	•	State the definition first before applying it.
-
-B. Validation Against Definition
-	•	Cross-check the definition with authoritative financial sources.
-	•	Ensure your conclusion follows from the validated definition.
-
-C. Example Application
-	•	Convert scenario details into clear variables and formulas.
-	•	Show intermediate calculations if numbers are given (even if approximate).
-	•	Keep number formatting and units consistent.
-
-D. Clarity & Structure
-	•	Use labeled steps (Step 1, Step 2, etc.).
-	•	Use short, clear sentences.
-	•	Avoid burying critical reasoning in long paragraphs.
-
-⸻
-
-# Reasoning Steps
-	1.	Identify the concept in question.
-	2.	State the authoritative definition.
-	3.	Break down any given scenario into relevant inputs and variables.
-	4.	Map variables into the appropriate financial formula(s).
-	5.	Calculate or logically deduce intermediate results.
-	6.	Compare the outcome against the definition to determine the correct classification or interpretation.
-	7.	State conclusion clearly and confidently, marking any assumptions.
-
-#Tool Usage
-- Use the File Search Tool to search the context file for the data.
-- Use the Internet Search Tool to search the internet for the data.
-- Use the Internet Search Tool to validate the formula.
-- Use the Internet Search Tool to validate the assumption.
-- Use the Internet Search Tool to find industry standards, formulas, or general financial knowledge.
-
-#Output Format
-- Only output in JSON format following the format below.
-
-- Example output:
-{
-  "classification": "conceptual",
-  "definition": "Authoritative definition of the concept in plain language.",
-  "scenario_analysis": [
-    {
-      "step": "Step number",
-      "description": "What is being done in this step",
-      "calculation": "If applicable, show the formula and how it's applied",
-      "result": "If applicable, show intermediate or final result"
-    }
-  ],
-  "validation": "How the final conclusion aligns with the authoritative definition",
-  "assumptions": ["List of any assumptions made"],
-  "final_conclusion": "The clear and concise answer to the conceptual question"
-}
 
-"""
-assumption_agent_prompt = """
-{RECOMMENDED_PROMPT_PREFIX}
-You are the **Financial Assumption Agent**—an expert system designed to solve complex financial questions that require logical assumptions, estimates, or filling in missing data.
-
-## CRITICAL REQUIREMENT: MANDATORY TOOL USAGE WITH CLEAR DISTINCTION
-
-### Tool 1: File Search Tool (Primary Data Source)
-- **Use this tool FIRST for ALL financial variables and data**
-- **Use this tool to search the provided financial context/document**
-- **This is your PRIMARY source of truth for company-specific financial data**
-- **Search queries should be specific**: "current portion long-term debt 2024", "lease liabilities Note 5", "RSUs PSUs stock-based compensation"
-
-### Tool 2: Internet Search Tool (Formula Validation & Assumption Support)
-- **Use this tool to validate financial formulas and calculation methods**
-- **Use this tool to validate assumptions you need to make**
-- **Use this tool to find industry standards, formulas, or general financial knowledge**
-- **Use this tool to verify if your assumptions are reasonable**
-
-## MANDATORY WORKFLOW
-
-### Phase 1: Generate Complete Plan with Formula Validation (NO CALCULATIONS YET)
-Before making any calculations, you MUST:
-1. **Understand the Question**: What financial metric/ratio is being requested?
-2. **Identify the Formula**: What is the mathematical relationship needed?
-3. **Validate the Formula**: Use Internet Search Tool to verify the correct formula
-4. **Map the Data Tree**: Break down the formula into its component parts
-5. **Classify Data Types**: For each component, identify if it's:
-   - **Retrievable**: Available in the provided context (MUST use File Search Tool first)
-   - **Assumable**: Can be reasonably estimated based on industry standards or context. Use Internet Search Tool to validate the assumption.
-
-### Phase 2: Execute Step-by-Step Resolution (MANDATORY TOOL USAGE)
-For each step in your plan:
-1. **State the Step**: Clearly articulate what you're calculating
-2. **Validate Formula**: Use Internet Search Tool to confirm the correct calculation method
-3. **FILE SEARCH FIRST**: Use the File Search Tool to find relevant data in the financial context
-4. **Document File Search Results**: Show exactly what you found in the context
-5. **If Data Found**: Use it directly, document the source
-6. **If Data NOT Found**: 
-   - Make a reasonable assumption
-   - Use Internet Search Tool to validate that assumption
-   - Document both the assumption and validation results
-7. **Calculate**: Perform the mathematical operation
-8. **Document**: Record the value, source, and any assumptions made
-
-### Phase 3: Final Calculation and Validation
-1. **Assemble Results**: Combine all calculated components
-2. **Verify Logic**: Does the final result make financial sense?
-3. **Check Assumptions**: Are all assumptions reasonable and documented?
-4. **Provide Confidence Level**: How certain are you of the result?
-
-IMPORTANT: After completing your analysis, you MUST call the transfer_to_critic_agent tool to send your response for review.
-DO NOT just say you want to handoff - you must actually call the transfer_to_critic_agent tool.
-
-When calling transfer_to_critic_agent, provide:
-- rationale: Why the critic needs to review this analysis
-- excerpt: The key calculations and assumptions that need review
-
-## TOOL USAGE REQUIREMENTS
-
-### File Search Tool (MANDATORY for all financial data):
-- **ALWAYS start with this tool** for any financial variable
-- **Search queries must be specific**: Use exact terms from financial statements
-- **Document every search**: Show the search query and results
-- **Examples of good searches**:
-  - "current portion long-term debt 2024"
-  - "lease liabilities Note 5 2024"
-  - "RSUs PSUs stock-based compensation 2024"
-  - "operating lease costs 2024"
-  - "variable lease costs 2024"
-
-### Internet Search Tool (Formula Validation & Assumption Support):
-- **Use to validate financial formulas** before applying them
-- **Use to validate assumptions** you need to make
-- **Use to find industry standards** or general financial knowledge
-- **Examples of appropriate internet searches**:
-  - **Formula Validation**: "market debt to equity ratio formula calculation"
-  - **Formula Validation**: "fully diluted shares outstanding calculation method RSUs PSUs"
-  - **Formula Validation**: "adjusted EBITDA calculation formula"
-  - **Assumption Validation**: "industry average lease liability calculation methods"
-  - **Assumption Validation**: "variable lease liability estimation methods retail industry"
-
-## FORMULA VALIDATION REQUIREMENTS
-- **Every financial formula must be validated** using Internet Search Tool
-- **Search for the specific formula** you plan to use
-- **Verify calculation methods** are current and industry-standard
-- **Document the validated formula** in your response
-- **Examples of formula validation searches**:
-  - "market debt to equity ratio = total debt / market value of equity"
-  - "fully diluted shares = common shares + RSUs + PSUs + stock options + warrants"
-  - "adjusted EBITDA = EBIT + D&A + one-time expenses + lease costs"
-
-
-## ENFORCEMENT MECHANISMS
-- **Formula validation first**: Every formula must be validated with Internet Search Tool
-- **File search second**: Every financial number must start with File Search Tool
-- **Assumption validation**: Every assumption must be validated with Internet Search Tool
-- **Source documentation**: Every number must have a documented source
-- **Calculation transparency**: Show the complete mathematical work
-
-## Output Format
-Structure your response as follows:
-
-```json
-{
-    "question": "What is the market debt to equity ratio?",
-    "formula_validation": {
-        "formula": "Market Debt to Equity = Total Debt / Market Value of Equity",
-        "internet_search_query": "market debt to equity ratio formula calculation method",
-        "internet_validation_result": "Confirmed: Market D/E = Total Debt / (Shares Outstanding × Price per Share). Total Debt includes all interest-bearing liabilities and debt equivalents.",
-        "formula_source": "Standard financial ratio calculation, validated via internet search"
-    },
-    "plan": [
-        "Step 1: Find total debt (current + long-term + lease liabilities)",
-        "Step 2: Find market value of equity (shares × price)",
-        "Step 3: Calculate ratio"
-    ],
-    "execution": {
-        "step_1": {
-            "description": "Find total debt components",
-            "formula_validation": {
-                "formula": "Total Debt = Current Debt + Long-term Debt + Lease Liabilities + Other Debt Equivalents",
-                "internet_search_query": "total debt calculation includes lease liabilities debt equivalents",
-                "internet_validation_result": "Confirmed: Total debt should include all interest-bearing obligations, operating leases, and debt equivalents for accurate leverage measurement."
-            },
-            "file_search_queries": [
-                "current portion long-term debt 2024",
-                "long-term debt excluding current portion 2024",
-                "lease liabilities Note 5 2024"
-            ],
-            "file_search_results": {
-                "current_debt": "Found: 103 million in Balance Sheet",
-                "long_term_debt": "Found: 5,794 million in Balance Sheet", 
-                "lease_liabilities": "Found: 4,052 million total in Note 5"
-            },
-            "assumptions_needed": [
-                "Variable lease liability not found in balance sheet"
-            ],
-            "assumption_validation": {
-                "assumption": "Variable lease liability can be estimated using cost ratio method",
-                "internet_search_query": "variable lease liability estimation methods retail industry cost ratio",
-                "internet_validation_result": "Industry practice: estimate variable lease liability using operating lease liability × (variable lease costs / operating lease costs)",
-                "assumption_calculation": "Variable lease liability = 2,554 × (163/284) = 1,466 million"
-            },
-            "final_calculation": "103 + 5,794 + 4,052 + 1,466 = 11,415 million",
-            "result": 11415,
-            "source": "Balance Sheet, Note 5, and calculated assumption"
-        },
-        "step_2": {
-            "description": "Find market value of equity",
-            "formula_validation": {
-                "formula": "Market Value of Equity = Fully Diluted Shares Outstanding × Price per Share",
-                "internet_search_query": "fully diluted shares outstanding calculation method RSUs PSUs",
-                "internet_validation_result": "Confirmed: Fully diluted shares = Common shares + RSUs + PSUs + Stock options + Warrants + Convertible securities (using treasury stock method)"
-            },
-            "file_search_queries": [
-                "common stock shares outstanding 2024",
-                "RSUs PSUs stock-based compensation 2024"
-            ],
-            "file_search_results": {
-                "common_shares": "Found: 442,793,000 in Balance Sheet",
-                "rsus_psus": "Found: 2,799,000 in Note 7 (in thousands)"
-            },
-            "calculation": "Fully diluted shares = 442,793,000 + 2,799,000 = 445,592,000",
-            "market_value": "445,592,000 × $940 = $418,856 million",
-            "result": 418856,
-            "source": "Balance Sheet, Note 7, and market price"
-        }
-    },
-    "final_calculation": "11,415 / 418,856 = 0.0273",
-    "final_result": 0.0273,
-    "units": "ratio (no units)",
-    "confidence_level": "High - All formulas validated, all components sourced from financial statements with validated assumptions",
-    "assumptions_made": [
-        "Variable lease liability estimated using cost ratio method (validated with industry practice)",
-        "Market price of $940 per share is current and accurate"
-    ]
-}
-```
-
-## CRITICAL FAILURE MODES TO AVOID
-1. **Not validating formulas with Internet Search Tool** - INSTANT FAILURE
-2. **Not using File Search Tool first for financial data** - INSTANT FAILURE
-3. **Making assumptions without Internet Search Tool validation** - INSTANT FAILURE
-4. **Not documenting search results** - INSTANT FAILURE
-5. **Not showing mathematical work** - INSTANT FAILURE
-
-## SUCCESS CRITERIA
-- Every financial formula is validated with Internet Search Tool
-- Every financial number starts with File Search Tool usage
-- Every assumption is validated with Internet Search Tool
-- Every calculation step shows complete mathematical work
-- The final answer matches the expected result within reasonable tolerance
-- All search queries and results are documented for both tools
-
-## TOOL USAGE SUMMARY
-1. **Internet Search Tool**: Use FIRST to validate formulas and calculation methods
-2. **File Search Tool**: Use SECOND for ALL financial variables and data
-3. **Internet Search Tool**: Use THIRD to validate assumptions when file search fails
-4. **Document everything**: Show formula validation, search queries, results, and validation for all tools
-
-Remember: Your goal is to create a complete audit trail that shows exactly how you arrived at your answer, with every formula validated, every value traceable to either the provided context (through File Search Tool) or a clearly justified assumption (validated with Internet Search Tool).
-IMPORTANT: You MUST call the transfer_to_critic_agent tool after completing your analysis.
-When calling transfer_to_critic_agent, provide:
-- rationale: Why the critic needs to review this analysis
-- excerpt: The key calculations and assumptions that need review
-"""
-
-conceptual_agent_prompt = """
-# Role and Objective
-You are the **Conceptual Financial Agent**—an expert system designed to answer finance questions that require conceptual understanding, definitions, explanations of relationships, or methodology, rather than direct calculation from company-specific data.
-
-# Instructions
-
-- The question you receive has already been determined to be conceptual.
-- Your primary goal is to provide clear, accurate, and concise conceptual answers to finance questions.
-- Do NOT attempt to calculate or estimate company-specific figures.
-- Use the provided context to inform your explanation, but focus on general financial principles, definitions, or methodologies.
-- If the question is ambiguous, clarify the conceptual aspect before proceeding.
-
-## Sub-categories for more detailed instructions
-
-1. **Definition/Explanation**: If the question asks for the meaning, definition, or explanation of a financial term, provide a clear and authoritative answer.
-2. **Relationship/Methodology**: If the question asks about the relationship between financial metrics, or how a calculation is performed in general, explain the methodology or relationship.
-3. **Comparative/Scenario Analysis**: If the question presents a scenario or comparison (e.g., "Which investment has a higher unlevered IRR?"), explain the conceptual reasoning and factors that would affect the answer, without using company-specific numbers.
-
-# Reasoning Steps
-
-1. ### Phase 1: Generate Complete Plan with Formula Validation (NO CALCULATIONS YET)
-Before making any calculations, you MUST:
-1. **Understand the Question**: What financial metric/ratio is being requested?
-2. **Identify the Formula**: What is the mathematical relationship needed?
-3. **Validate the Formula**: Use Internet Search Tool to verify the correct formula
-4. **Map the Data Tree**: Break down the formula into its component parts
-5. **Classify Data Types**: For each component, identify if it's:
-   - **Retrievable**: Available in the provided context (MUST use File Search Tool first)
-   - **Assumable**: Can be reasonably estimated based on industry standards or context. Use Internet Search Tool to validate the assumption.
-
-
-# Output Format
-
-Respond in the following JSON format:
-
-{
-    "question": "<original user question>",
-    "category": "conceptual",
-    "sub_category": "<definition | relationship | scenario>",
-    "answer": "<your conceptual answer>",
-    "reason": "<why this is a conceptual question and how you arrived at your answer>",
-    "references": "<optional: any context or general sources that informed your answer>"
-}
-"""
+triage_agent_prompt = load_prompt("triage.md")
+basic_agent_prompt = load_prompt("basic.md")
+assumption_agent_prompt = load_prompt("assumption.md")
+conceptual_agent_prompt = load_prompt("conceptual.md")
+critic_agent_prompt = load_prompt("critic.md")
+formula_critic_agent_prompt = load_prompt("formula_critic.md")
+
+
+class TriageClassification(BaseModel):
+    classification: Literal["tactical_basic", "tactical_assumption_based", "conceptual"]
+    reason: str
+    search_results: str
+
+
+class ScenarioStep(BaseModel):
+    step: str
+    description: str
+    calculation: str
+    result: str
+
+
+class BasicAnswer(BaseModel):
+    classification: str
+    definition: str
+    scenario_analysis: List[ScenarioStep]
+    validation: str
+    assumptions: List[str]
+    final_conclusion: str
+
 
-critic_agent_prompt = """
-You are a reflective AI agent tasked with critically analyzing financial analyses. Your job is to review a given context, question, and the response provided by another agent. Then, you must reflect on the analysis and provide a detailed critique.
-Your tasks are:
-• Carefully read the provided context, question, and response.
-• Analyze whether the question was correctly understood and addressed.
-• Verify if the correct numbers were extracted from tables and text in the context. Double-check these numbers against the original context.
-• Check the accuracy of the calculations in each step provided. Recalculate each step to ensure correctness.
-• Verify if the logic of the steps provided is sound and appropriate for answering the question.
-• Assess if the final answer calculation is correct. Perform the calculation independently to confirm.
+class ConceptualAnswer(BaseModel):
+    question: str
+    category: Literal["conceptual"]
+    sub_category: Literal["definition", "relationship", "scenario"]
+    answer: str
+    reason: str
+    references: str
+
+
+class FormulaValidation(BaseModel):
+    formula: str
+    internet_search_query: str
+    internet_validation_result: str
 
 
-"""
+class FileSearchFinding(BaseModel):
+    variable: str
+    query: str
+    result: str
 
 
+class AssumptionValidation(BaseModel):
+    assumption: str
+    internet_search_query: str
+    internet_validation_result: str
+    assumption_calculation: str
+
+
+class AssumptionStep(BaseModel):
+    description: str
+    formula_validation: FormulaValidation
+    file_search_results: List[FileSearchFinding]
+    assumption_validations: List[AssumptionValidation]
+    calculation: str
+    result: float
+    source: str
+
+
+class AssumptionAnalysis(BaseModel):
+    """The assumption agent's analysis, passed to the critic as the handoff input."""
+
+    question: str
+    formula_validation: FormulaValidation
+    plan: List[str]
+    execution: List[AssumptionStep]
+    final_calculation: str
+    final_result: float
+    units: str
+    confidence_level: str
+    assumptions_made: List[str]
+
+
+class FormulaReview(BaseModel):
+    formula: str
+    is_standard: bool
+    issues: List[str]
+    recommended_formula: str
+    sources: str
+
+
+@dataclasses.dataclass
+class TriageRunContext:
+    """Per-question state shared by the agents of one triage run."""
+
+    question: str
+    formula_review: Optional[asyncio.Task] = None
+    # The review's JSON output once awaited, so the critic's turns share it
+    formula_review_output: Optional[object] = None
+    formula_review_resolved: bool = False
+    analysis: Optional[AssumptionAnalysis] = None
+    # Set when a specialist failed, so a partial answer is not cached
+    incomplete: bool = False
+
+
+def start_formula_review(ctx: RunContextWrapper[TriageRunContext]) -> None:
+    """Start the formula review as soon as triage hands off to the assumption agent.
+
+    The review only needs the question, so it runs while the assumption agent
+    works through its steps, and the critic receives it when it takes over.
+    """
+    run_context = ctx.context
+    if isinstance(run_context, TriageRunContext) and run_context.formula_review is None:
+        run_context.formula_review = asyncio.create_task(
+            Runner.run(formula_critic_agent, run_context.question)
+        )
+
+
+def record_analysis(ctx: RunContextWrapper[TriageRunContext], analysis: AssumptionAnalysis) -> None:
+    """Keep the assumption analysis the critic receives, for the run report."""
+    if isinstance(ctx.context, TriageRunContext):
+        ctx.context.analysis = analysis
+
+
+async def formula_review_result(run_context) -> Optional[object]:
+    """The formula review of a run, or None if none ran or it failed.
+
+    The review is awaited once; later calls return the stored result.
+    """
+    if not isinstance(run_context, TriageRunContext) or run_context.formula_review is None:
+        return None
+    if not run_context.formula_review_resolved:
+        run_context.formula_review_resolved = True
+        try:
+            run_context.formula_review_output = output_to_json(
+                (await run_context.formula_review).final_output
+            )
+        except Exception as exc:
+            logger.warning(f"Formula review failed: {type(exc).__name__}: {exc}")
+    return run_context.formula_review_output
+
+
+async def critic_instructions(ctx: RunContextWrapper[TriageRunContext], agent: Agent) -> str:
+    """Critic prompt with the parallel formula review appended, when there is one."""
+    review = await formula_review_result(ctx.context)
+    if review is None:
+        return critic_agent_prompt + "\nNo independent formula review is available.\n"
+    return critic_agent_prompt + f"\nIndependent formula review:\n{json.dumps(review)}\n"
+
 
 critic_agent = Agent(
     name="critic_agent",
     model="gpt-4o",
-    instructions=critic_agent_prompt,
-    tools=[file_search_tool, web_search_tool]
+    instructions=critic_instructions,
+    model_settings=ModelSettings(temperature=0, max_tokens=1200),
+    tools=[cached_file_search, web_search_tool]
+)
+
+formula_critic_agent = Agent(
+    name="formula_critic_agent",
+    model="gpt-4o",
+    instructions=formula_critic_agent_prompt,
+    # No max_tokens: the issues list is unbounded, and a truncated review is lost
+    model_settings=ModelSettings(temperature=0),
+    output_type=FormulaReview,
+    tools=[web_search_tool]
 )
 
 basic_agent = Agent(
     name="basic_agent",
     model="gpt-4o",
-    tools=[file_search_tool],
-    instructions=basic_agent_prompt
+    tools=[basic_file_search],
+    instructions=basic_agent_prompt,
+    model_settings=ModelSettings(temperature=0, max_tokens=1500),
+    output_type=BasicAnswer
 )
 
 assumption_agent = Agent(
     name="assumption_agent",
     model="gpt-4o",
-    tools=[file_search_tool, web_search_tool],
+    tools=[cached_file_search, web_search_tool],
     instructions=assumption_agent_prompt,
-    handoffs=[critic_agent]
+    # No max_tokens: the calculation tree grows with the number of steps, and a
+    # truncated handoff input fails the whole run
+    model_settings=ModelSettings(temperature=0),
+    # The analysis travels as the handoff input, so the critic always has it;
+    # a structured output would end the run before the handoff
+    handoffs=[
+        handoff(critic_agent, input_type=AssumptionAnalysis, on_handoff=record_analysis)
+    ]
 )
 
 conceptual_agent = Agent(
     name="conceptual_agent",
     model="gpt-4o",
-    instructions=conceptual_agent_prompt
+    instructions=conceptual_agent_prompt,
+    # No max_tokens: scenario answers run to several steps, and a truncated
+    # structured output fails the whole run
+    model_settings=ModelSettings(temperature=0),
+    output_type=ConceptualAnswer
 )
 
+# Specialists reachable as triage tools. The assumption agent is deliberately
+# absent: it is only reachable by handoff, so it never runs twice per question.
+SPECIALIST_AGENTS = {
+    "basic": basic_agent,
+    "conceptual": conceptual_agent,
+}
+
+
+def output_to_json(output) -> object:
+    """Make an agent's final output JSON serializable."""
+    if isinstance(output, BaseModel):
+        return output.model_dump()
+    return str(output)
+
+
+# The specialist tools' output becomes the run's final output (see StopAtTools
+# below), so their failures are raised instead of being returned to the model
+# as error text that would be reported and cached as the answer.
+@function_tool(failure_error_function=None)
+async def consult_multiple_specialists(
+    ctx: RunContextWrapper[TriageRunContext],
+    question: str,
+    categories: List[Literal["basic", "conceptual"]],
+) -> str:
+    """Ask several specialists the same question at once and return all answers.
+
+    Use when the classification is ambiguous between categories, or when one
+    answer should be cross-checked against another specialist's. A specialist
+    that fails is reported with its error; the call fails only if all do.
+
+    Args:
+        question: The question, including any context the specialists need.
+        categories: The specialists to consult.
+    """
+    selected = list(dict.fromkeys(categories))
+    results = await asyncio.gather(
+        *(Runner.run(SPECIALIST_AGENTS[category], question) for category in selected),
+        return_exceptions=True,
+    )
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures and len(failures) == len(results):
+        raise failures[0]
+    if failures and isinstance(ctx.context, TriageRunContext):
+        ctx.context.incomplete = True
+    return json.dumps(
+        {
+            category: (
+                {"error": f"{type(result).__name__}: {result}"}
+                if isinstance(result, BaseException)
+                else output_to_json(result.final_output)
+            )
+            for category, result in zip(selected, results)
+        }
+    )
+
+
+# Triage tools whose output is a specialist's answer, with the agent(s) behind them
+SPECIALIST_TOOLS = {
+    "consult_basic_specialist": lambda arguments: [basic_agent.name],
+    "consult_conceptual_specialist": lambda arguments: [conceptual_agent.name],
+    "consult_multiple_specialists": lambda arguments: [
+        SPECIALIST_AGENTS[category].name for category in arguments.get("categories", [])
+    ],
+}
+
+
 triage_agent = Agent(
     name="triage_agent",
-    model="gpt-4o",
+    # Triage only classifies and routes, so a smaller model is enough here
+    model=os.getenv("TRIAGE_MODEL", "gpt-4o-mini"),
     tools=[
-        file_search_tool,
+        cached_file_search,
         web_search_tool,
         basic_agent.as_tool(
             tool_name="consult_basic_specialist",
             tool_description="Use when the question is classified as basic.",
-        ),
-        assumption_agent.as_tool(
-            tool_name="consult_assumption_specialist",
-            tool_description="Use when the question is classified as assumption-based.",
+            failure_error_function=None,
         ),
         conceptual_agent.as_tool(
             tool_name="consult_conceptual_specialist",
             tool_description="Use when the question is classified as conceptual.",
+            failure_error_function=None,
         ),
+        consult_multiple_specialists,
     ],
-    handoffs=[basic_agent, assumption_agent, conceptual_agent],
-    instructions=triage_agent_prompt   
+    # Basic and conceptual answers are one-shot, so those specialists are only
+    # tools; the assumption agent's critic chain is only reachable by handoff.
+    # Stopping at the specialist tools makes their answer the final output.
+    tool_use_behavior=StopAtTools(stop_at_tool_names=list(SPECIALIST_TOOLS)),
+    handoffs=[handoff(assumption_agent, on_handoff=start_formula_review)],
+    instructions=triage_agent_prompt,
+    # Leaves room for the free-text search_results field
+    model_settings=ModelSettings(temperature=0, max_tokens=1000),
+    output_type=TriageClassification
 )
 
-async def main():
-    client = OpenAI()
-    
-    vector_store = client.vector_stores.create(
-        name="financial_context",
+
+class TriageCache:
+    """Cache of triage run outputs keyed by question, context and model.
+
+    Entries live in process memory, and in Redis as well when ``REDIS_URL`` is
+    set, so repeated questions skip the whole agent pipeline. Redis errors are
+    logged and the in-memory entries are used alone.
+    """
+
+    def __init__(self, ttl: int = 3600, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._redis = None
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url and aioredis is not None:
+            self._redis = aioredis.Redis.from_url(redis_url)
+
+    @staticmethod
+    def key(question: str, context_id: str, model: str) -> str:
+        return hashlib.sha256(json.dumps([question, context_id, model]).encode("utf-8")).hexdigest()
+
+    async def lookup(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(f"triage:{key}")
+            except aioredis.RedisError as exc:
+                logger.warning(f"Triage cache lookup in Redis failed: {exc}")
+                return None
+            if raw is not None:
+                value = json.loads(raw)
+                self._store(key, value)
+                return value
+        return None
+
+    async def update(self, key: str, value: dict) -> None:
+        self._store(key, value)
+        if self._redis is not None:
+            try:
+                await self._redis.set(f"triage:{key}", json.dumps(value), ex=self.ttl)
+            except aioredis.RedisError as exc:
+                logger.warning(f"Triage cache update in Redis failed: {exc}")
+
+    def _store(self, key: str, value: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+triage_cache = TriageCache(ttl=int(os.getenv("TRIAGE_CACHE_TTL", "3600")))
+
+
+def specialist_tool_agents(new_items) -> Optional[List[str]]:
+    """Agents behind the specialist tool the run stopped at, if it stopped at one.
+
+    With ``StopAtTools`` the final output is that tool's output, while
+    ``result.last_agent`` is still the triage agent. Any specialist call ends
+    the run, so specialist outputs only appear in the final turn, possibly
+    next to search outputs from the same turn; like ``StopAtTools``, the
+    first one is taken.
+    """
+    specialist_calls = {
+        getattr(item.raw_item, "call_id", None): item.raw_item
+        for item in new_items
+        if isinstance(item, ToolCallItem) and getattr(item.raw_item, "name", None) in SPECIALIST_TOOLS
+    }
+    for item in new_items:
+        if not isinstance(item, ToolCallOutputItem):
+            continue
+        raw_output = item.raw_item
+        call_id = raw_output.get("call_id") if isinstance(raw_output, dict) else getattr(raw_output, "call_id", None)
+        call = specialist_calls.get(call_id)
+        if call is not None:
+            try:
+                arguments = json.loads(getattr(call, "arguments", None) or "{}")
+            except json.JSONDecodeError:
+                arguments = {}
+            return SPECIALIST_TOOLS[call.name](arguments)
+    return None
+
+
+def summarize_run(result) -> dict:
+    """Final output, the agent that produced it, and the handoffs and tool calls on the way."""
+    new_items = getattr(result, "new_items", None) or []
+    tool_agents = specialist_tool_agents(new_items)
+    return {
+        "final_output": output_to_json(result.final_output),
+        "last_agent": ", ".join(tool_agents) if tool_agents else result.last_agent.name,
+        "answered_by_tool": tool_agents is not None,
+        "handoffs": [
+            f"{item.source_agent.name} -> {item.target_agent.name}"
+            for item in new_items
+            if isinstance(item, HandoffOutputItem)
+        ],
+        "tool_calls": [
+            getattr(item.raw_item, "name", None) or item.raw_item.type
+            for item in new_items
+            if isinstance(item, ToolCallItem)
+        ],
+    }
+
+
+async def run_triage(question: str, stream: bool = False):
+    """Run the triage pipeline for a question, serving repeats from the cache.
+
+    With ``stream`` set, text deltas are printed as the model produces them.
+    A handoff to the assumption agent starts the formula review, which runs
+    alongside the analysis and is handed to the critic. If the run ends
+    without the critic, an unfinished review is cancelled.
+    """
+    key = TriageCache.key(question, context_hash(), str(triage_agent.model))
+    cached = await triage_cache.lookup(key)
+    if cached is not None:
+        if stream:
+            print(cached["final_output"])
+        return SimpleNamespace(
+            **{
+                "handoffs": [],
+                "tool_calls": [],
+                "answered_by_tool": False,
+                "analysis": None,
+                "formula_review": None,
+                **cached,
+            }
+        )
+
+    run_context = TriageRunContext(question=question)
+    try:
+        if stream:
+            result = Runner.run_streamed(triage_agent, question, context=run_context)
+            async for event in result.stream_events():
+                if isinstance(event, RawResponsesStreamEvent) and isinstance(event.data, ResponseTextDeltaEvent):
+                    print(event.data.delta, end="", flush=True)
+        else:
+            result = await Runner.run(triage_agent, question, context=run_context)
+    except BaseException:
+        if run_context.formula_review is not None:
+            run_context.formula_review.cancel()
+        raise
+    summary = summarize_run(result)
+    if stream:
+        print()
+        # Specialist tools run nested, so their answer never streams through
+        # the outer run; show it once the run has stopped at the tool
+        if summary["answered_by_tool"]:
+            print(summary["final_output"])
+
+    summary["analysis"] = output_to_json(run_context.analysis) if run_context.analysis else None
+    review_task = run_context.formula_review
+    if review_task is not None and not run_context.formula_review_resolved and not review_task.done():
+        # The critic never ran, so nothing needs the review; do not wait for it
+        review_task.cancel()
+        summary["formula_review"] = None
+    else:
+        summary["formula_review"] = await formula_review_result(run_context)
+    if not run_context.incomplete:
+        await triage_cache.update(key, summary)
+    return SimpleNamespace(**summary)
+
+
+def build_batch_request(custom_id: str, question: str, vector_store_id: str) -> dict:
+    """Build one Batch API line that runs the triage hop for a question."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/responses",
+        "body": {
+            "model": triage_agent.model,
+            "instructions": triage_agent_prompt,
+            "input": question,
+            "temperature": 0,
+            "max_output_tokens": 1000,
+            "text": {
+                "format": {
+                    "type": "json_schema",
+                    "name": "triage_classification",
+                    "schema": AgentOutputSchema(TriageClassification).json_schema(),
+                    "strict": True,
+                }
+            },
+            "tools": [
+                {
+                    "type": "file_search",
+                    "vector_store_ids": [vector_store_id],
+                    "max_num_results": 5,
+                }
+            ],
+        },
+    }
+
+
+def extract_output_text(body: dict) -> str:
+    """Concatenate the output_text parts of a Responses API body."""
+    return "".join(
+        part.get("text", "")
+        for item in body.get("output", [])
+        if item.get("type") == "message"
+        for part in item.get("content", [])
+        if part.get("type") == "output_text"
     )
 
-    client.vector_stores.files.upload_and_poll(
-        vector_store_id=vector_store.id,
-        file=open("src/data/context.txt", "rb"),
+
+async def run_batch(client: AsyncOpenAI, questions: List[str], vector_store_id: str) -> Dict[str, str]:
+    """Submit the questions through the Batch API and wait for the results.
+
+    Batch requests are plain Responses API calls, so only the triage hop runs
+    here; handoffs to the specialist agents are not followed.
+    """
+    lines = [
+        json.dumps(build_batch_request(f"q{i}", question, vector_store_id))
+        for i, question in enumerate(questions, 1)
+    ]
+    batch_file = await client.files.create(
+        file=("questions.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/responses",
+        completion_window="24h",
     )
-    #print(vector_store.id,"vector store id")
+    logger.info(f"Submitted batch {batch.id} with {len(lines)} questions")
+
+    poll_seconds = int(os.getenv("BATCH_POLL_SECONDS", "30"))
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_seconds)
+        batch = await client.batches.retrieve(batch.id)
+        logger.info(f"Batch {batch.id}: {batch.status}")
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
+
+    results: Dict[str, str] = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                results[record["custom_id"]] = f"ERROR: {record.get('error') or response.get('body')}"
+            else:
+                results[record["custom_id"]] = extract_output_text(response["body"])
+    return results
+
+
+async def main(batch: bool = False):
+    set_default_openai_client(get_async_client())
     
     # Define your list of questions
     questions = [
@@ -530,41 +763,90 @@ async def main():
     ]
     
   
-    # Process each question
-    for i, question in enumerate(questions, 1):
+    # Offline evaluation: submit everything through the Batch API instead
+    if batch:
+        vector_store_id = await asyncio.to_thread(ensure_vector_store, get_client())
+        results = await run_batch(get_async_client(), questions, vector_store_id)
+        for i, question in enumerate(questions, 1):
+            logger.info(f"\n{'='*60}")
+            logger.info(f"Question {i}: {question}")
+            logger.info(f"{'='*60}")
+            logger.info(results.get(f"q{i}", "No result returned"))
+        return
+
+    # Bound the number of in-flight runs so we stay under the API rate limits
+    sem = asyncio.Semaphore(int(os.getenv("QPS_CONCURRENCY", "10")))
+
+    # Stream tokens for a single interactive question; concurrent runs would
+    # interleave their deltas, so those print once they are complete
+    stream = len(questions) == 1
+
+    async def run_one(question):
+        async with sem:
+            # Each gather task has its own context, so this cache is per question
+            reset_search_cache()
+            # One failing question (rate limit, malformed output) must not
+            # discard the answers to the others
+            try:
+                return await run_triage(question, stream=stream)
+            except Exception as exc:
+                return exc
+
+    # The streamed header and tokens are printed directly so they stay in order
+    if stream:
         print(f"\n{'='*60}")
-        print(f"Question {i}: {question}")
+        print(f"Question 1: {questions[0]}")
         print(f"{'='*60}")
-        
-        # Start from the assumption agent
-        agent = triage_agent
-        
-        # Run the agent and capture the result
-        result = await Runner.run(agent, question)
 
-        print(result.final_output)
+    # Run all questions concurrently; results come back in question order
+    results = await asyncio.gather(*(run_one(q) for q in questions))
+
+    for i, (question, result) in enumerate(zip(questions, results), 1):
+        if not stream:
+            logger.info(f"\n{'='*60}")
+            logger.info(f"Question {i}: {question}")
+            logger.info(f"{'='*60}")
+
+        if isinstance(result, Exception):
+            logger.error(f"\n❌ Question {i} failed: {type(result).__name__}: {result}")
+            logger.info("-" * 40)
+            continue
+
+        if not stream:
+            logger.info(result.final_output)
 
         
-        # Check if handoff occurred by looking at the final output
-        if hasattr(result, 'final_output'):
-            if 'critique' in str(result.final_output).lower() or 'review' in str(result.final_output).lower():
-                print(f"\n✅ HANDOFF CONFIRMED: Critic agent provided review!")
-                print(f"Critic Agent Output: {result.final_output}")
-            else:
-                print(f"\n⚠️ No handoff detected - only assumption agent output received")
+        # Report the handoffs the run actually took, from the SDK's run items
+        if result.handoffs:
+            logger.info(f"\n🔀 Handoffs: {', '.join(result.handoffs)}")
+            if result.last_agent == critic_agent.name:
+                logger.info(f"\n✅ HANDOFF CONFIRMED: Critic agent provided review!")
+        else:
+            logger.info(f"\n⚠️ No handoff detected")
+        logger.info(f"Final output from: {result.last_agent}")
         
-        # Try to access tool usage from the result object
-        if hasattr(result, 'tool_usage'):
-            print(f"\n🔧 Tools Used: {result.tool_usage}")
-        if hasattr(result, 'intermediate_steps'):
-            print(f"\n Intermediate Steps: {result.intermediate_steps}")
-        if hasattr(result, 'tool_calls'):
-            print(f"\n🔧 Tool Calls: {result.tool_calls}")
+        if result.tool_calls:
+            logger.info(f"\n🔧 Tool Calls: {', '.join(result.tool_calls)}")
+        if result.analysis:
+            logger.info(f"\n🧮 Assumption Analysis: {result.analysis}")
+        if result.formula_review:
+            logger.info(f"\n📐 Formula Review: {result.formula_review}")
         
-        print("-" * 40)
+        logger.info("-" * 40)
 
  
        
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Financial question answering agents")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="submit the questions through the OpenAI Batch API (triage hop only)",
+    )
+    args = parser.parse_args()
+    listener = configure_logging()
+    try:
+        asyncio.run(main(batch=args.batch))
+    finally:
+        listener.stop()